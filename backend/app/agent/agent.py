@@ -1,12 +1,21 @@
+import io
 import os
+import re
 import json
+import orjson
+import asyncio
+import hashlib
+import itertools
+import threading
+import time
+from collections import OrderedDict
 import pandas as pd
 from dotenv import load_dotenv
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.messages import HumanMessage, SystemMessage, AIMessage, ToolMessage
 
-from .tools.data_fetch import fetch_data_from_resource
-from .tools.code_interpreter import run_python_code
+from .tools.data_fetch import fetch_data_from_resource_async, CROP_PRODUCTION_ID, CROP_PRICE_ID
+from .tools.code_interpreter import run_python_code_async, SharedFrames, PLOT_MARKER
 
 dotenv_path = os.path.join(os.path.dirname(__file__), '..', '..', '..', '.env')
 load_dotenv(dotenv_path=dotenv_path)
@@ -15,8 +24,47 @@ GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 if not GOOGLE_API_KEY:
     raise ValueError("GOOGLE_API_KEY not found in .env file")
 
-CROP_PRODUCTION_ID = "35be999b-0208-4354-b557-f6ca9a5355de"
-CROP_PRICE_ID = "9ef84268-d588-465a-a308-a864a43d0070"
+# Shared Gemini clients. Building one sets up gRPC channels and auth, so agents
+# share a small pool (round-robin) instead of each constructing their own.
+LLM_MODEL = "gemini-pro-latest"
+LLM_POOL_SIZE = 4
+_llm_pool = None
+_llm_pool_lock = threading.Lock()
+
+
+def _get_llm() -> ChatGoogleGenerativeAI:
+    """Returns the next client from the shared pool, creating the pool on first use."""
+    global _llm_pool
+    with _llm_pool_lock:
+        if _llm_pool is None:
+            _llm_pool = itertools.cycle([
+                ChatGoogleGenerativeAI(model=LLM_MODEL, google_api_key=GOOGLE_API_KEY, temperature=0.0)
+                for _ in range(LLM_POOL_SIZE)
+            ])
+        return next(_llm_pool)
+
+# Start of a {"tool_call": ...} or {"tool_calls": [...]} object in the LLM's text
+_TOOL_CALL_START_RE = re.compile(r'\{\s*"tool_calls?"\s*:')
+# orjson has no raw_decode, so stdlib's decoder stays as the fallback for
+# tool calls followed by more text
+_JSON_DECODER = json.JSONDecoder()
+
+# Whole-word references to the loaded dataframes in analysis code
+_DF_REF = re.compile(r'\bdf_(crop|price)\b')
+
+# LLM response cache: temperature is 0, so an identical history gives an identical reply.
+# Set SAMARTH_LLM_CACHE=off to always call Gemini (e.g. while editing the prompt).
+LLM_CACHE_ENABLED = os.getenv("SAMARTH_LLM_CACHE", "on").lower() != "off"
+LLM_CACHE_MAX_ENTRIES = 256
+# Entries expire so a cached reply can't outlive e.g. a model or prompt change for long
+LLM_CACHE_TTL_SECONDS = 600
+_llm_cache: OrderedDict[str, tuple[float, str | list]] = OrderedDict() # {key: (expires_at, content)}
+
+
+def _history_hash(history) -> str:
+    """md5 over the (type, content) pairs of a message history."""
+    serialized = orjson.dumps([(m.type, m.content) for m in history], default=str)
+    return hashlib.md5(serialized).hexdigest()
 
 
 SYSTEM_PROMPT = """
@@ -29,6 +77,7 @@ You have access to two live datasets, which you can load using the `get_data` to
     - Key Columns: `state_name`, `district_name`, `crop_year`, `season`, `crop`, `area_`, `production_`
 2.  `crop_prices`: Contains daily market-level prices for commodities.
     - Key Columns: `state`, `district`, `market`, `commodity`, `arrival_date`, `min_price`, `max_price`, `modal_price`
+Numeric columns are already numeric (missing values are NaN) and `arrival_date` is already a datetime.
 
 **TOOLS:**
 You MUST use the following JSON format to call a tool. Do not add any other text outside the JSON block.
@@ -41,6 +90,15 @@ You MUST use the following JSON format to call a tool. Do not add any other text
   }
 }
 
+If you need several tool calls that do NOT depend on each other (e.g. loading both `crop_production` and `crop_prices`), emit them together as an array so they run in parallel:
+{
+  "tool_calls": [
+    {"name": "get_data", "args": {"dataset_name": "crop_production"}},
+    {"name": "get_data", "args": {"dataset_name": "crop_prices"}}
+  ]
+}
+Never batch a call with another call that needs its result (e.g. `analyze_data` on data that is still being loaded).
+
 **Tool 1: get_data**
 Loads data from one of the live sources into memory. You must do this before you can analyze.
 - `name`: "get_data"
@@ -52,7 +110,7 @@ Loads data from one of the live sources into memory. You must do this before you
 # (Keep DATA SOURCES and Tool 1 description)
 
 **Tool 2: analyze_data**
-Runs Python code (using Pandas as `pd`, json, matplotlib.pyplot as `plt`, seaborn as `sns`) to analyze the data you've loaded. Loaded data is available in DataFrames named `df_crop` and `df_price`.
+Runs Python code (using Pandas as `pd`, NumPy as `np`, json, matplotlib.pyplot as `plt`, seaborn as `sns`, `numexpr`) to analyze the data you've loaded. Loaded data is available in DataFrames named `df_crop` and `df_price`.
 - `name`: "analyze_data"
 - `args`:
   - `code` (str): A multi-line string of Python code. MUST use `print()` to output ALL findings and results clearly.
@@ -60,7 +118,7 @@ Runs Python code (using Pandas as `pd`, json, matplotlib.pyplot as `plt`, seabor
     - Generate the plot using `plt` or `sns`.
     - **YOU MUST save the plot by calling `plt.savefig(__plot_filename__)`**. Do not use `plt.show()`.
     - The tool will automatically capture the saved plot.
-- Returns: The text output from your `print()` statements. If a plot was saved, the output will also include `[Plot saved: base64_encoded_image_string]`.
+- Returns: The text output from your `print()` statements. If a plot was saved, the output will also include `[Plot produced, stored as plot_N]`; the image itself is shown to the user, not to you.
 
 **IMPORTANT ANALYSIS GUIDELINES for your Python code:**
 1.  **Clean Data First:** (Keep existing cleaning instructions)
@@ -69,6 +127,7 @@ Runs Python code (using Pandas as `pd`, json, matplotlib.pyplot as `plt`, seabor
 2.  **Perform Calculations:** (Keep existing calculation instructions)
     * ...
     * ...
+    * For filters on large frames, prefer `df.query('state_name == "X" and crop_year == 2000')` over chained boolean masks, and `df.eval('yield_ = production_ / area_')` for column arithmetic; both run in numexpr without building Python-level temporaries.
 3.  **Generate Plots (If Requested):**
     * Create clear plots (line plots for trends, bar charts for comparisons).
     * **Always add titles and axis labels (`plt.title()`, `plt.xlabel()`, `plt.ylabel()`)**.
@@ -81,12 +140,21 @@ Runs Python code (using Pandas as `pd`, json, matplotlib.pyplot as `plt`, seabor
         * **If data for some requested items was missing:** Clearly state which items were missing and why (e.g., "within the fetched records"). Then, present the findings for the data that *was* found.
         * **If a plot was generated:** Mention that the plot is displayed below. If the plot only shows partial data due to missing items, briefly explain this (e.g., "The chart below shows data only for Andhra Pradesh as data for Tamil Nadu was not found."). Ensure your plotting code adjusts titles appropriately if possible."""
 
+# Built once and shared by every run; the prompt never changes at runtime
+_SYSTEM_MSG = SystemMessage(content=SYSTEM_PROMPT)
+
 class SamarthAgent:
 
     def __init__(self):
-        self.llm = ChatGoogleGenerativeAI(model="gemini-pro-latest", google_api_key=GOOGLE_API_KEY, temperature=0.0)
+        self.llm = _get_llm()
 
         self.last_plot_data = None
+        # Set when the last run ended in an error (LLM failure, unparseable reply,
+        # turn limit) rather than an answer, so callers don't cache or reuse it
+        self.last_run_failed = False
+        # Base64 plots produced during the current run. Only a short tag goes
+        # into the LLM history, the image itself never does.
+        self._plots: list[str] = []
 
         # Data storage
         self.df_crop = pd.DataFrame()
@@ -96,6 +164,19 @@ class SamarthAgent:
         self.crop_title = ""
         self.price_title = ""
         self.data_loaded = set()
+        # Row limit each dataset was fetched with. Agents kept across a chat
+        # session reuse loaded data when a later get_data asks for no more rows.
+        self._loaded_limits: dict[str, int] = {}
+
+        # Parallel get_data calls both write the shared dataframe state
+        self._data_lock = asyncio.Lock()
+
+        # Progress callback for the current run (see `run`)
+        self._on_event = None
+
+        # Loaded dataframes exported to shared memory for the analysis workers.
+        # Built lazily on the first analyze_data and dropped whenever data changes.
+        self._shared_frames: SharedFrames | None = None
 
         self.resource_ids = {
             "crop_production": CROP_PRODUCTION_ID,
@@ -103,17 +184,31 @@ class SamarthAgent:
         }
 
     
-    def _get_data(self, dataset_name: str, limit: int = 5000) -> str:
+    async def _get_data(self, dataset_name: str, limit: int = 5000) -> str:
         """Helper function to call our data_fetch tool."""
         if dataset_name not in self.resource_ids:
             return f"Error: Unknown dataset '{dataset_name}'. Use 'crop_production' or 'crop_prices'."
 
+        if self._loaded_limits.get(dataset_name, 0) >= limit:
+            if dataset_name == "crop_production":
+                return f"`df_crop` is already loaded with {len(self.df_crop)} records (Source: {self.crop_title})"
+            return f"`df_price` is already loaded with {len(self.df_price)} records (Source: {self.price_title})"
+
         resource_id = self.resource_ids[dataset_name]
-        df, title = fetch_data_from_resource(resource_id, limit=limit)
+        df, title = await fetch_data_from_resource_async(resource_id, limit=limit)
 
         if df.empty:
             return f"Error: Failed to fetch data for '{dataset_name}'."
 
+        async with self._data_lock:
+            self._loaded_limits[dataset_name] = limit
+            return self._store_data(dataset_name, df, title)
+
+    def _store_data(self, dataset_name: str, df: pd.DataFrame, title: str) -> str:
+        """Stores a fetched DataFrame on the agent. Caller must hold `_data_lock`."""
+        # Tool batches run every get_data before any analyze_data, so no
+        # analysis is still reading the old export at this point
+        self._release_shared_frames()
         if dataset_name == "crop_production":
             self.df_crop = df
             self.crop_title = title
@@ -132,114 +227,245 @@ class SamarthAgent:
              return f"Error: Unhandled dataset name '{dataset_name}' after fetching."
         
 
-    def _analyze_data(self, code: str) -> str:
+    async def _analyze_data(self, code: str) -> str:
         """Helper function to call our code_interpreter tool."""
         
         # Check if the code *mentions* a df that isn't loaded (preventive check)
-        if "df_crop" in code and self.df_crop.empty:
+        referenced = set(_DF_REF.findall(code))
+        if "crop" in referenced and "crop_production" not in self.data_loaded:
             return "Error: `df_crop` is referenced in code but not loaded. Call `get_data('crop_production')` first."
-        if "df_price" in code and self.df_price.empty:
+        if "price" in referenced and "crop_prices" not in self.data_loaded:
             return "Error: `df_price` is referenced in code but not loaded. Call `get_data('crop_prices')` first."
             
-        # Build the dictionary of *currently loaded* dataframes to pass to the interpreter
-        dataframes_to_pass = {}
-        if not self.df_crop.empty:
-            dataframes_to_pass["df_crop"] = self.df_crop
-        if not self.df_price.empty:
-            dataframes_to_pass["df_price"] = self.df_price
-
-        # The run_python_code function will handle errors during execution
-        return run_python_code(code, dataframes_to_pass)
+        async with self._data_lock:
+            if self._shared_frames is None:
+                # Export the *currently loaded* dataframes once; reused until data changes
+                dataframes_to_pass = {}
+                if not self.df_crop.empty:
+                    dataframes_to_pass["df_crop"] = self.df_crop
+                if not self.df_price.empty:
+                    dataframes_to_pass["df_price"] = self.df_price
+                self._shared_frames = await asyncio.to_thread(SharedFrames, dataframes_to_pass)
+            shared_frames = self._shared_frames
+
+        # Runs in the worker pool; run_python_code handles errors during execution
+        return await run_python_code_async(code, shared_frames)
+
+    def _release_shared_frames(self):
+        if self._shared_frames is not None:
+            self._shared_frames.close()
+            self._shared_frames = None
+
+    def close(self):
+        """Releases the shared memory holding this agent's dataframes."""
+        self._release_shared_frames()
     
-    def _parse_llm_response(self, response) -> (dict | None, str | None):
+    def _parse_llm_response(self, response) -> (list[dict] | None, str | None):
         """
         Parses the LLM's response robustly to find the FIRST valid tool call
-        or assemble the final answer text. Handles complex content structures.
+        block (a single `tool_call` or a `tool_calls` array) or assemble the
+        final answer text. Handles complex content structures.
 
         Returns:
-            tuple: (tool_call_dict, None) if a valid tool call is found.
+            tuple: (list_of_tool_call_dicts, None) if a valid tool call is found.
                 (None, final_answer_string) if no tool call found and text exists.
                 (None, error_string) if parsing fails badly.
         """
         # --- Defensive Checks ---
         if not isinstance(response, AIMessage):
             print(f"Warning: Expected AIMessage, but got {type(response)}")
+            self.last_run_failed = True
             return None, f"Agent received an unexpected response type: {type(response)}"
         if not hasattr(response, 'content'):
             print("Warning: AIMessage response object has no 'content' attribute.")
+            self.last_run_failed = True
             return None, "Agent received a response with no content."
 
         content = response.content
-        potential_tool_call_json = None
-        final_answer_parts = []
+        buf = io.StringIO() # Text parts, newline-separated
 
         # --- Process Content (String or List) ---
         content_list = [content] if isinstance(content, str) else content
 
         if isinstance(content_list, list):
             for item in content_list:
-                item_text = ""
                 if isinstance(item, str):
                     item_text = item.strip()
                 elif isinstance(item, dict) and 'text' in item:
                     item_text = item['text'].strip()
                 else:
                     # Collect unexpected parts as part of final answer (for debugging)
-                    final_answer_parts.append(f"[Unexpected Content Part: {str(item)}]")
-                    continue # Skip parsing this part
-
-                # --- Prioritize Finding the FIRST Tool Call ---
-                if potential_tool_call_json is None and item_text.startswith("{") and item_text.endswith("}"):
-                    try:
-                        data = json.loads(item_text)
-                        if isinstance(data, dict) and "tool_call" in data:
-                            tool_call_content = data["tool_call"]
-                            if isinstance(tool_call_content, dict) and "name" in tool_call_content:
-                                # Found the first valid tool call, store it and stop looking
-                                potential_tool_call_json = tool_call_content
-                                print(f"Parser found valid tool call: {potential_tool_call_json.get('name')}")
-                                # Don't break yet, collect remaining text for potential final answer if tool call fails upstream
-                    except json.JSONDecodeError:
-                        # Invalid JSON, treat as text
-                        final_answer_parts.append(item_text)
-                    except Exception as e:
-                        print(f"Error parsing potential JSON tool call item: {e}")
-                        final_answer_parts.append(item_text) # Treat as text on error
-                else:
-                    # Not a potential tool call JSON, add to final answer parts
-                    if item_text: # Avoid adding empty strings
-                        final_answer_parts.append(item_text)
+                    item_text = f"[Unexpected Content Part: {str(item)}]"
+                if item_text: # Avoid adding empty strings
+                    buf.write(item_text)
+                    buf.write("\n")
         else:
             # Content was not a string or list
             print(f"Warning: LLM response content has unexpected type: {type(content)}")
+            self.last_run_failed = True
             return None, f"Agent response content had an unexpected format: {str(content)}"
 
+        joined = buf.getvalue()
 
-        # --- Return Based on Findings ---
-        if potential_tool_call_json:
-            # If we found a tool call, return it, ignore any text found after it for now
-            return potential_tool_call_json, None
+        # --- Find the FIRST Tool Call ---
+        # The regex only locates where a tool call object starts. Usually the
+        # object runs to the last '}' (at most a code fence after it), so orjson
+        # parses that span directly; otherwise raw_decode finds exactly where
+        # the object ends, however deeply nested its args are.
+        last_brace = joined.rfind("}") + 1
+        for match in _TOOL_CALL_START_RE.finditer(joined):
+            try:
+                data = orjson.loads(joined[match.start():last_brace])
+            except orjson.JSONDecodeError:
+                try:
+                    data, end_index = _JSON_DECODER.raw_decode(joined, match.start())
+                except json.JSONDecodeError:
+                    continue # Looked like a tool call but isn't valid JSON, keep scanning
+            calls = data.get("tool_calls", [data.get("tool_call")])
+            if isinstance(calls, list):
+                valid_calls = [c for c in calls if isinstance(c, dict) and "name" in c]
+                if valid_calls:
+                    # If we found a tool call, return it, ignore any surrounding text for now
+                    print(f"Parser found valid tool call(s): {[c.get('name') for c in valid_calls]}")
+                    return valid_calls, None
+
+        # --- No tool call found, the text is the final answer ---
+        final_answer = joined.strip()
+        if final_answer:
+            print("Parser returning final answer text.")
+            return None, final_answer
         else:
-            # No tool call found, assemble final answer from text parts
-            final_answer = "\n".join(final_answer_parts).strip()
-            if final_answer:
-                print("Parser returning final answer text.")
-                return None, final_answer
-            else:
-                # Handle cases where parsing results in empty text
-                print("Warning: LLM response parsed to empty text and no tool call found.")
-                return None, "[Agent produced an empty response after parsing.]"
+            # Handle cases where parsing results in empty text
+            print("Warning: LLM response parsed to empty text and no tool call found.")
+            self.last_run_failed = True
+            return None, "[Agent produced an empty response after parsing.]"
     
-    def run(self, query: str, max_turns: int = 5) -> tuple[str, str | None]:
+    async def _cached_invoke(self, message_history) -> AIMessage:
+        """Calls the LLM, reusing a previous reply for an identical history."""
+        if not LLM_CACHE_ENABLED:
+            return await self.llm.ainvoke(message_history)
+
+        key = _history_hash(message_history)
+        cached = _llm_cache.get(key)
+        if cached is not None:
+            expires_at, content = cached
+            if time.monotonic() < expires_at:
+                _llm_cache.move_to_end(key)
+                print(f"LLM cache hit ({key}).")
+                return AIMessage(content=content)
+            del _llm_cache[key]
+
+        response = await self.llm.ainvoke(message_history)
+        # Empty (e.g. blocked) replies aren't cached, so the next try calls Gemini again
+        content = response.content if isinstance(response, AIMessage) else None
+        if content and (not isinstance(content, str) or content.strip()):
+            _llm_cache[key] = (time.monotonic() + LLM_CACHE_TTL_SECONDS, content)
+            if len(_llm_cache) > LLM_CACHE_MAX_ENTRIES:
+                _llm_cache.popitem(last=False)
+        return response
+
+    async def _execute_tool(self, tool_call: dict) -> str:
+        """
+        Executes a single parsed tool call and returns its result as text.
+        Plots are left in the text; `_execute_tool_calls` extracts them.
+        """
+        tool_name = tool_call.get("name")
+        # Malformed calls ("args": null, "args": "crop_production") become empty
+        # args, so they fail inside the try below as a recoverable tool error
+        tool_args = tool_call.get("args") if isinstance(tool_call.get("args"), dict) else {}
+        print(f"Agent (Executing Tool Call): {tool_name}({tool_args})")
+
+        tool_result_str = "[TOOL EXECUTION FAILED]" # Default error
+
+        if tool_name == "get_data":
+            self._emit(status=f"Fetching `{tool_args['dataset_name']}` data..." if 'dataset_name' in tool_args else "Fetching data...")
+        elif tool_name == "analyze_data":
+            self._emit(status="Running analysis...")
+
+        try:
+            if tool_name == "get_data":
+                tool_result_str = await self._get_data(dataset_name=tool_args.get('dataset_name'),
+                                                       limit=int(tool_args.get('limit', 5000)))
+
+            elif tool_name == "analyze_data":
+                tool_result_str = await self._analyze_data(code=tool_args.get('code'))
+
+            else:
+                tool_result_str = f"Error: Unknown tool '{tool_name}'."
+
+        except Exception as tool_err:
+             tool_result_str = f"Error executing tool '{tool_name}': {tool_err}"
+             print(f"!!! Exception during tool execution: {tool_err}") # Add specific log
+
+        print(f"Tool Result: {tool_result_str[:500]}...")
+        return tool_result_str
+
+    def _extract_plot(self, tool_result_str: str) -> str:
+        """
+        Moves a plot out of a tool result into `self._plots` / `self.last_plot_data`,
+        leaving a `plot_N` tag. The base64 image would otherwise be re-sent to
+        Gemini every turn.
+        """
+        if PLOT_MARKER in tool_result_str:
+            start_index = tool_result_str.find(PLOT_MARKER)
+            end_index = tool_result_str.find("]", start_index)
+            if end_index != -1:
+                self._plots.append(tool_result_str[start_index + len(PLOT_MARKER):end_index])
+                self.last_plot_data = self._plots[-1]
+                tool_result_str = tool_result_str[:start_index].strip()
+                tool_result_str += f"\n[Plot produced, stored as plot_{len(self._plots) - 1}]"
+                print("Agent extracted plot data from tool result.")
+            else:
+                print("Warning: Found plot marker but couldn't find end bracket.")
+        return tool_result_str
+
+    async def _execute_tool_calls(self, tool_calls: list[dict]) -> list[str]:
+        """
+        Executes a batch of tool calls, returning results in the same order.
+
+        `get_data` calls are network-bound and independent, so they run
+        concurrently. The remaining calls (`analyze_data` runs in the worker
+        pool) start only after every fetch has finished, in case the batch
+        mixes loading a dataset with analysing it. Those run concurrently too,
+        so plots are extracted afterwards in call order: `plot_N` tags and
+        `last_plot_data` follow the order the LLM issued the calls, not the
+        order the analyses happened to finish in.
+        """
+        results: list[str | None] = [None] * len(tool_calls)
+
+        fetch_indices = [i for i, call in enumerate(tool_calls) if call.get("name") == "get_data"]
+        other_indices = [i for i in range(len(tool_calls)) if i not in fetch_indices]
+        for indices in (fetch_indices, other_indices):
+            if indices:
+                batch = await asyncio.gather(*(self._execute_tool(tool_calls[i]) for i in indices))
+                for i, result in zip(indices, batch):
+                    results[i] = result
+
+        return [self._extract_plot(result) for result in results]
+
+    def _emit(self, **frame):
+        """Reports progress to the current run's `on_event` callback, if any."""
+        if self._on_event is not None:
+            self._on_event(frame)
+
+    async def run(self, query: str, max_turns: int = 5, on_event=None) -> tuple[str, str | None]:
         """
         Runs the main agent reasoning loop.
 
+        Args:
+            on_event: Optional callable receiving progress dicts such as
+                {"status": "Running analysis..."} while the agent works.
+
         Returns:
-            tuple: (final_answer_string, base64_plot_data_or_None)
+            tuple: (final_answer_string, base64_plot_data_or_None). If the run
+            failed, the string is an error message and `last_run_failed` is set.
         """
         self.last_plot_data = None # Reset plot data for this run
+        self.last_run_failed = False
+        self._plots = []
+        self._on_event = on_event
         message_history = [
-            SystemMessage(content=SYSTEM_PROMPT),
+            _SYSTEM_MSG,
             HumanMessage(content=query)
         ]
 
@@ -250,24 +476,27 @@ class SamarthAgent:
             print(f"Current History (types): {[msg.__class__.__name__ for msg in message_history]}")
 
             # 1. Call LLM
+            self._emit(status="Thinking..." if i == 0 else f"Thinking (step {i+1})...")
             try:
-                response = self.llm.invoke(message_history)
+                response = await self._cached_invoke(message_history)
                 # (Keep logging and AIMessage check from previous version)
                 raw_content = getattr(response, 'content', '[NO CONTENT ATTRIBUTE]')
                 print(f"LLM Raw Response Content: {raw_content}")
                 if not isinstance(response, AIMessage):
                     error_msg = f"LLM returned unexpected type: {type(response)}. Content: {raw_content}"
                     print(error_msg)
+                    self.last_run_failed = True
                     return error_msg, None # Return error and no plot
                 message_history.append(response)
             except Exception as llm_err:
                 error_msg = f"Error during LLM invocation: {llm_err}"
                 print(error_msg)
+                self.last_run_failed = True
                 return error_msg, None # Return error and no plot
 
             # 2. Parse response
-            tool_call, final_answer = self._parse_llm_response(response)
-            print(f"Parsed Tool Call: {tool_call}")
+            tool_calls, final_answer = self._parse_llm_response(response)
+            print(f"Parsed Tool Calls: {tool_calls}")
             print(f"Parsed Final Answer: {final_answer}")
 
             # 3. If it's a final answer, return it WITH any stored plot data
@@ -281,86 +510,52 @@ class SamarthAgent:
                 # Return final answer AND the stored plot data
                 return final_answer, self.last_plot_data
 
-            # 4. If it's a tool call, execute it
-            if tool_call is not None:
-                tool_name = tool_call.get("name")
-                tool_args = tool_call.get("args", {})
-                print(f"Agent (Executing Tool Call): {tool_name}({tool_args})")
-
-                # --- Inside the 'if tool_call is not None:' block ---
-                tool_result = "[TOOL EXECUTION FAILED]" # Default error
-                tool_result_str = tool_result # Initialize
-
-                try:
-                    # --- Ensure consistent indentation here ---
-                    if tool_name == "get_data":
-                        # This line MUST be indented relative to the 'if'
-                        tool_result = self._get_data(dataset_name=tool_args.get('dataset_name'),
-                                                     limit=int(tool_args.get('limit', 5000)))
-                        # The result also needs to be converted to string here
-                        tool_result_str = str(tool_result)
-
-                    elif tool_name == "analyze_data":
-                        # This block MUST be indented relative to the 'elif'
-                        tool_result = self._analyze_data(code=tool_args.get('code'))
-                        tool_result_str = str(tool_result) # Ensure string initially
-
-                        # --- PLOT HANDLING LOGIC (indented under elif) ---
-                        plot_marker = "[Plot saved: "
-                        if plot_marker in tool_result_str:
-                             start_index = tool_result_str.find(plot_marker)
-                             end_index = tool_result_str.find("]", start_index)
-                             if end_index != -1:
-                                 self.last_plot_data = tool_result_str[start_index + len(plot_marker):end_index]
-                                 tool_result_str = tool_result_str[:start_index].strip()
-                                 print("Agent extracted plot data from tool result.")
-                             else:
-                                 print("Warning: Found plot marker but couldn't find end bracket.")
-                        # --- END PLOT HANDLING ---
+            # 4. If it's a tool call (or a batch of them), execute it
+            if tool_calls:
+                tool_results = await self._execute_tool_calls(tool_calls)
 
+                # Results go back in the order the LLM issued the calls
+                for tool_call, tool_result_str in zip(tool_calls, tool_results):
+                    if len(tool_calls) == 1:
+                        result_message = HumanMessage(content=f"[Tool Result: {tool_result_str}]")
                     else:
-                        # This block MUST be indented relative to the 'else'
-                        tool_result = f"Error: Unknown tool '{tool_name}'."
-                        tool_result_str = tool_result # Re-assign error string
-
-                except Exception as tool_err:
-                     # This block MUST be indented relative to the 'except'
-                     tool_result_str = f"Error executing tool '{tool_name}': {tool_err}"
-                     print(f"!!! Exception during tool execution: {tool_err}") # Add specific log
-
-                # (The rest of the code: print, HumanMessage, append)
-                print(f"Tool Result (Text after plot extraction): {tool_result_str[:500]}...")
-                result_message = HumanMessage(content=f"[Tool Result: {tool_result_str}]")
-                message_history.append(result_message)
-                # --- End of 'if tool_call is not None:' block ---
+                        result_message = HumanMessage(content=f"[Tool Result ({tool_call.get('name')}): {tool_result_str}]")
+                    message_history.append(result_message)
 
             # (Keep defensive break)
-            if final_answer is None and tool_call is None:
+            if final_answer is None and not tool_calls:
                 print("Error: Parsing failed to produce tool call or final answer. Stopping.")
+                self.last_run_failed = True
                 return "Agent parsing failed unexpectedly.", None
 
 
         # If max_turns reached
+        self.last_run_failed = True
         return f"Agent could not reach a final answer after {max_turns} turns.", self.last_plot_data
 
 
 # --- Testing Block ---
 if __name__ == "__main__":
-    agent = SamarthAgent()
+    async def main():
+        agent = SamarthAgent()
 
-    
-    query_1 = "What is the total production of 'Rice' in the state 'Andhra Pradesh' for the year 2000? Use the crop_production dataset and fetch 10000 records to be safe."
-    answer_1 = agent.run(query_1)
-    
-    print("\n" + "="*50 + "\n")
-    print(f"**Final Answer for Query 1:**\n{answer_1}")
-    print("\n" + "="*50 + "\n")
 
-    
-    agent_2 = SamarthAgent()
-    query_2 = "What are the 3 most common commodities in the 'crop_prices' dataset? Fetch 1000 records."
-    answer_2 = agent_2.run(query_2)
-    
-    print("\n" + "="*50 + "\n")
-    print(f"**Final Answer for Query 2:**\n{answer_2}")
-    print("\n" + "="*50 + "\n")
\ No newline at end of file
+        query_1 = "What is the total production of 'Rice' in the state 'Andhra Pradesh' for the year 2000? Use the crop_production dataset and fetch 10000 records to be safe."
+        answer_1 = await agent.run(query_1)
+        agent.close()
+
+        print("\n" + "="*50 + "\n")
+        print(f"**Final Answer for Query 1:**\n{answer_1}")
+        print("\n" + "="*50 + "\n")
+
+
+        agent_2 = SamarthAgent()
+        query_2 = "What are the 3 most common commodities in the 'crop_prices' dataset? Fetch 1000 records."
+        answer_2 = await agent_2.run(query_2)
+        agent_2.close()
+
+        print("\n" + "="*50 + "\n")
+        print(f"**Final Answer for Query 2:**\n{answer_2}")
+        print("\n" + "="*50 + "\n")
+
+    asyncio.run(main())
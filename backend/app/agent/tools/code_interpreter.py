@@ -1,20 +1,278 @@
 import pandas as pd
+import numpy as np
 import json
 import io
+import os
 import sys
-from contextlib import redirect_stdout
+import threading
+import asyncio
+import functools
+from collections import OrderedDict
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+from contextlib import contextmanager, redirect_stdout
+import matplotlib
 import matplotlib.pyplot as plt
 import seaborn as sns
-import tempfile # For creating temporary files
+import pyarrow as pa
+import numexpr
 import base64   # For encoding the image
-import os
 
-from .data_fetch import fetch_data_from_resource
+# Let pandas evaluate arithmetic, comparisons and reductions in numexpr/bottleneck
+# (C, multi-threaded, no Python-level temporaries) rather than plain numpy
+pd.options.compute.use_numexpr = True
+pd.options.compute.use_bottleneck = True
+
+# Marks the base64 plot appended to run_python_code's output
+PLOT_MARKER = "[Plot saved: "
+
+# Names available to every snippet. Copied per call (exec adds __builtins__ to
+# its globals), with the plot buffer and loaded DataFrames layered on top.
+_BASE_GLOBALS = {
+    'pd': pd,
+    'np': np,
+    'json': json,
+    'plt': plt,
+    'sns': sns,
+    'numexpr': numexpr,
+}
+
+# Appended to every snippet so figures don't linger in the worker between calls
+_PLOT_CLEANUP = "\nplt.clf()\nplt.close('all')"
+
+# --- Worker pool ---
+# Analysis code runs in long-lived worker processes: the API's event loop stays
+# free while pandas works, pandas/matplotlib are imported once per worker rather
+# than per call, and a crash in generated code can't take the server down.
+# Per API process; SAMARTH_ANALYSIS_WORKERS lowers it on small hosts
+WORKER_COUNT = int(os.getenv("SAMARTH_ANALYSIS_WORKERS", 2))
+_pool: ProcessPoolExecutor | None = None
+
+
+def _warmup():
+    """Runs once in each worker: import-time and backend setup happen here, not in the first call."""
+    matplotlib.use("Agg")
+    plt.close(plt.figure())
+    # Copy-on-write: the shallow copies handed to snippets share data with the
+    # cached frames, and CoW makes any write to them (.loc assignment,
+    # fillna(inplace=True), ...) copy first instead of editing the cache
+    pd.options.mode.copy_on_write = True
+
+
+def _ping() -> bool:
+    return True
+
+
+def get_worker_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # spawn, not fork: the parent holds gRPC channels (Gemini) and an event loop
+        _pool = ProcessPoolExecutor(max_workers=WORKER_COUNT,
+                                    mp_context=multiprocessing.get_context("spawn"),
+                                    initializer=_warmup)
+    return _pool
+
+
+def start_worker_pool():
+    """Starts the workers ahead of the first analyze_data call (e.g. at app startup)."""
+    pool = get_worker_pool()
+    for _ in range(WORKER_COUNT):
+        pool.submit(_ping)
+
+
+def shutdown_worker_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def _export_dataframes(dataframes: dict[str, pd.DataFrame]):
+    """
+    Writes DataFrames as Arrow IPC streams into a single shared memory block,
+    so workers can read them without pickling each frame through a pipe.
+
+    Returns:
+        tuple: (SharedMemory or None, {name: (offset, size)}, {name: df})
+            Frames Arrow can't represent (e.g. mixed-type object columns)
+            are returned in the last dict to be pickled as usual.
+    """
+    tables, inline = {}, {}
+    for name, df in dataframes.items():
+        try:
+            tables[name] = pa.Table.from_pandas(df)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            inline[name] = df
+
+    sizes = {}
+    for name, table in tables.items():
+        sink = pa.MockOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        sizes[name] = sink.size()
+
+    if not tables:
+        return None, {}, inline
+
+    shm = shared_memory.SharedMemory(create=True, size=sum(sizes.values()))
+    layout = {}
+    offset = 0
+    for name, table in tables.items():
+        size = sizes[name]
+        sink = pa.FixedSizeBufferWriter(pa.py_buffer(shm.buf[offset:offset + size]))
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        layout[name] = (offset, size)
+        offset += size
+    return shm, layout, inline
+
+
+class SharedFrames:
+    """
+    A set of DataFrames exported once into shared memory.
+
+    Holders (e.g. an agent) keep one of these per loaded dataset state and pass it
+    to every `run_python_code_async` call, so the Arrow export happens once per
+    data load instead of once per analysis. Call `close()` when the data changes.
+    """
+
+    def __init__(self, dataframes: dict[str, pd.DataFrame]):
+        self._shm, self.layout, self.inline = _export_dataframes(dataframes)
+        self.name = self._shm.name if self._shm else None
+
+    def close(self):
+        if self._shm is not None:
+            self._shm.close()
+            self._shm.unlink()
+            self._shm = None
+
+
+# Per-worker cache of DataFrames already rebuilt from shared memory, keyed by
+# segment name. Lets repeated analyses on the same data skip the Arrow read.
+WORKER_FRAME_CACHE_SIZE = 4
+_worker_frames: OrderedDict = OrderedDict()
+
+
+def _release_frames(shm, dataframes: dict):
+    dataframes.clear()
+    if shm is not None:
+        try:
+            shm.close()
+        except BufferError:
+            pass # A view is still alive; the mapping goes away with it
+
+
+def _load_shared_frames(shm_name: str, layout: dict) -> dict[str, pd.DataFrame]:
+    """Rebuilds (or reuses) the DataFrames stored in a shared memory segment."""
+    if shm_name in _worker_frames:
+        _worker_frames.move_to_end(shm_name)
+        return _worker_frames[shm_name][1]
+
+    shm = shared_memory.SharedMemory(name=shm_name)
+    dataframes = {}
+    for name, (offset, size) in layout.items():
+        reader = pa.ipc.open_stream(pa.py_buffer(shm.buf[offset:offset + size]))
+        dataframes[name] = reader.read_all().to_pandas()
+        del reader
+
+    _worker_frames[shm_name] = (shm, dataframes)
+    while len(_worker_frames) > WORKER_FRAME_CACHE_SIZE:
+        _release_frames(*_worker_frames.popitem(last=False)[1])
+    return dataframes
+
+
+def _run_in_worker(code: str, shm_name: str | None, layout: dict, inline: dict) -> str:
+    """Worker entry point: rebuilds the DataFrames from shared memory and runs the code."""
+    dataframes = dict(inline)
+    if shm_name:
+        # Shallow copies, so column adds/drops in one snippet don't leak into the
+        # cache; copy-on-write (set in _warmup) does the same for value edits
+        for name, df in _load_shared_frames(shm_name, layout).items():
+            dataframes[name] = df.copy(deep=False)
+    return run_python_code(code, dataframes)
+
+
+async def run_python_code_async(code: str, dataframes: "dict[str, pd.DataFrame] | SharedFrames") -> str:
+    """
+    Runs `run_python_code` in the worker pool without blocking the event loop.
+    Same return contract as `run_python_code`.
+
+    Accepts either a dict of DataFrames (exported for this call only) or a
+    `SharedFrames` the caller keeps alive across calls.
+    """
+    global _pool
+    owned = not isinstance(dataframes, SharedFrames)
+    frames = await asyncio.to_thread(SharedFrames, dataframes) if owned else dataframes
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(get_worker_pool(), _run_in_worker,
+                                          code, frames.name, frames.layout, frames.inline)
+    except BrokenProcessPool:
+        # A worker died (e.g. out of memory); start a fresh pool next time
+        _pool = None
+        return "[Error executing code]: The analysis worker crashed. Try a smaller computation."
+    finally:
+        if owned:
+            frames.close()
+
+
+@contextmanager
+def _capture_stdout():
+    """
+    Captures everything written to stdout inside the block into the yielded bytearray.
+
+    fd 1 is pointed at an os.pipe() and a reader thread drains it, so large prints
+    go through the kernel pipe buffer instead of a Python-level StringIO.write per
+    chunk. Only safe where nothing else is printing concurrently (the pool workers).
+    Falls back to redirect_stdout when stdout has no real file descriptor.
+    """
+    buf = bytearray()
+    try:
+        fd = sys.stdout.fileno()
+    except (AttributeError, ValueError, io.UnsupportedOperation):
+        fd = None
+
+    if fd is None:
+        stdout_capture = io.StringIO()
+        try:
+            with redirect_stdout(stdout_capture):
+                yield buf
+        finally:
+            buf.extend(stdout_capture.getvalue().encode('utf-8'))
+        return
+
+    sys.stdout.flush()
+    r, w = os.pipe()
+    saved = os.dup(fd)
+    reader = threading.Thread(
+        target=lambda: buf.extend(b''.join(iter(lambda: os.read(r, 65536), b''))),
+        daemon=True,
+    )
+    reader.start()
+    os.dup2(w, fd)
+    try:
+        yield buf
+    finally:
+        sys.stdout.flush()
+        os.dup2(saved, fd)
+        os.close(saved)
+        os.close(w)  # Last write end closed -> reader sees EOF
+        reader.join()
+        os.close(r)
+
+
+@functools.lru_cache(maxsize=64)
+def _compile_code(code: str):
+    """Compiles a snippet (plus plot cleanup) once; retries and re-queries reuse the code object."""
+    return compile(code + _PLOT_CLEANUP, "<agent>", "exec")
+
 
 def run_python_code(code: str, dataframes: dict[str, pd.DataFrame]) -> str:
     """
-    Executes Python code, captures stdout, and saves any generated plot
-    to a temporary file, returning the plot as a base64 encoded string.
+    Executes Python code, captures stdout, and captures any generated plot
+    in memory, returning the plot as a base64 encoded string.
 
     Args:
         code (str): The Python code to execute.
@@ -27,59 +285,34 @@ def run_python_code(code: str, dataframes: dict[str, pd.DataFrame]) -> str:
              Returns an error message on failure.
     """
     plot_output = None
-    stdout_capture = io.StringIO()
 
     try:
-        # Create a temporary file *without* automatically deleting it
-        # We'll handle deletion after reading it
-        with tempfile.NamedTemporaryFile(suffix=".png", delete=False) as temp_plot_file:
-            temp_plot_filename = temp_plot_file.name
-
-        # Safe environment: Add plotting libraries and the temp filename
-        safe_globals = {
-            'pd': pd,
-            'json': json,
-            'plt': plt,
-            'sns': sns,
-            '__plot_filename__': temp_plot_filename, # Pass filename to the code
-            **dataframes
-        }
+        # plt.savefig accepts file-like objects, so the plot never touches disk
+        plot_buffer = io.BytesIO()
+
+        # Safe environment: Base libraries plus the plot buffer and dataframes
+        safe_globals = {**_BASE_GLOBALS, '__plot_filename__': plot_buffer, **dataframes}
 
         # Redirect stdout and execute code
-        with redirect_stdout(stdout_capture):
-            # IMPORTANT: Add plot closing logic to the user's code
+        with _capture_stdout() as stdout_bytes:
+            # IMPORTANT: The compiled code includes plot closing logic
             # This ensures plots don't linger in memory
-            code_to_execute = code + "\nplt.clf()\nplt.close('all')"
-            exec(code_to_execute, safe_globals, {})
+            exec(_compile_code(code), safe_globals, {})
 
-        # Check if a plot file was actually created/modified
         # The code MUST call plt.savefig(__plot_filename__)
-        if os.path.exists(temp_plot_filename) and os.path.getsize(temp_plot_filename) > 0:
-            # Read the saved plot and encode it
-            with open(temp_plot_filename, "rb") as f:
-                image_bytes = f.read()
-                plot_output = base64.b64encode(image_bytes).decode('utf-8')
-            print(f"Plot generated and saved to {temp_plot_filename}") # Debug print
+        if plot_buffer.tell() > 0:
+            plot_output = base64.b64encode(plot_buffer.getbuffer()).decode('ascii')
+            print("Plot generated and captured in memory.") # Debug print
         else:
-             print("No plot file generated or file is empty.") # Debug print
+             print("No plot generated.") # Debug print
 
     except Exception as e:
-        # Clean up the temp file if it exists, even on error
-        if 'temp_plot_filename' in locals() and os.path.exists(temp_plot_filename):
-            os.remove(temp_plot_filename)
         return f"[Error executing code]: {str(e)}"
-    finally:
-        # Always clean up the plot file if it exists
-        if 'temp_plot_filename' in locals() and os.path.exists(temp_plot_filename):
-             try:
-                 os.remove(temp_plot_filename)
-             except OSError:
-                 pass # Ignore error if file already removed or inaccessible
 
     # Combine stdout and plot output
-    final_output = stdout_capture.getvalue()
+    final_output = stdout_bytes.decode(sys.stdout.encoding or 'utf-8', errors='replace')
     if plot_output:
-        final_output += f"\n[Plot saved: {plot_output}]" # Add encoded string marker
+        final_output += f"\n{PLOT_MARKER}{plot_output}]" # Add encoded string marker
 
     if not final_output:
         return "[No output was printed. The code ran successfully.]"
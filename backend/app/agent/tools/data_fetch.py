@@ -1,9 +1,13 @@
 import os
-import requests
+import time
+import asyncio
+import atexit
+from pathlib import Path
+import httpx
+import orjson
 import pandas as pd
 from dotenv import load_dotenv
 from io import StringIO
-import json
 
 dotenv_path = os.path.join(os.path.dirname(__file__), '..', '..', '..', '..', '.env')
 load_dotenv(dotenv_path=dotenv_path)
@@ -11,41 +15,160 @@ load_dotenv(dotenv_path=dotenv_path)
 DATA_GOV_API_KEY = os.getenv("DATA_GOV_API_KEY")
 BASE_URL = "https://api.data.gov.in/resource/"
 
-def fetch_data_from_resource(resource_id: str, limit: int = 1000) -> (pd.DataFrame, str):
+CROP_PRODUCTION_ID = "35be999b-0208-4354-b557-f6ca9a5355de"
+CROP_PRICE_ID = "9ef84268-d588-465a-a308-a864a43d0070"
+
+# Known schemas: passing columns to from_records skips per-record key inference
+_CROP_COLS = ["state_name", "district_name", "crop_year", "season", "crop", "area_", "production_"]
+_PRICE_COLS = ["state", "district", "market", "commodity", "variety", "grade",
+               "arrival_date", "min_price", "max_price", "modal_price"]
+_KNOWN_COLUMNS = {
+    CROP_PRODUCTION_ID: _CROP_COLS,
+    CROP_PRICE_ID: _PRICE_COLS,
+}
+
+# Ingest dtypes. Years fit in int16 and prices in float32 (FP64 -> FP32 halves
+# their memory). Area and production stay float64: totals are reported verbatim,
+# and float32's ~7 significant digits would round sums and large values.
+# Text columns stay plain strings: categoricals keep every category after a
+# filter, so value_counts(), groupby and seaborn plots of a filtered frame
+# would list empty districts/crops from the rest of the data.
+_CROP_DTYPES = {
+    "crop_year": "int16", "area_": "float64", "production_": "float64",
+}
+_PRICE_DTYPES = {
+    "min_price": "float32", "max_price": "float32", "modal_price": "float32",
+}
+_INGEST_DTYPES = {
+    CROP_PRODUCTION_ID: _CROP_DTYPES,
+    CROP_PRICE_ID: _PRICE_DTYPES,
+}
+
+# On-disk cache of fetched resources. (resource_id, limit) fully determines the
+# payload within an hour, so re-reading a local Parquet file beats re-downloading.
+CACHE_DIR = Path.home() / ".cache" / "samarth"
+CACHE_TTL_SECONDS = 3600
+# Part of the file name; bump it when the ingest dtypes change so old files are ignored
+CACHE_VERSION = 3
+
+# Shared client: keeps the TCP+TLS connection to data.gov.in alive across calls
+_CLIENT = httpx.AsyncClient(http2=True, timeout=30, limits=httpx.Limits(max_keepalive_connections=8))
+
+
+def _close_client():
+    try:
+        asyncio.run(_CLIENT.aclose())
+    except Exception:
+        pass # Interpreter is shutting down, nothing useful to do
+
+atexit.register(_close_client)
+
+
+def _cache_path(resource_id: str, limit: int) -> Path:
+    return CACHE_DIR / f"{resource_id}_{limit}_v{CACHE_VERSION}.parquet"
+
+
+def _read_cache(resource_id: str, limit: int) -> (pd.DataFrame | None, str):
+    """Returns the cached (df, title) if a fresh copy exists, else (None, "")."""
+    path = _cache_path(resource_id, limit)
+    try:
+        if path.exists() and time.time() - path.stat().st_mtime < CACHE_TTL_SECONDS:
+            df = pd.read_parquet(path)
+            title = orjson.loads(path.with_suffix('.json').read_bytes())["title"]
+            print(f"Loaded {len(df)} cached records from '{title}'")
+            return df, title
+    except Exception as e:
+        print(f"Warning: Ignoring unreadable cache file {path}: {e}")
+    return None, ""
+
+
+def _write_cache(resource_id: str, limit: int, df: pd.DataFrame, title: str):
+    path = _cache_path(resource_id, limit)
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Title sidecar first: a parquet file without one is treated as a miss
+        path.with_suffix('.json').write_bytes(orjson.dumps({"title": title}))
+        df.to_parquet(path, engine="pyarrow", compression="zstd")
+    except Exception as e:
+        print(f"Warning: Could not write cache file {path}: {e}")
+
+
+def _records_to_dataframe(resource_id: str, records: list[dict]) -> pd.DataFrame:
+    columns = _KNOWN_COLUMNS.get(resource_id)
+    if columns is not None and set(records[0]) != set(columns):
+        print(f"Warning: Schema of resource '{resource_id}' changed, inferring columns.")
+        columns = None
+    df = pd.DataFrame.from_records(records, columns=columns)
+    return _apply_ingest_dtypes(resource_id, df)
+
+
+def _apply_ingest_dtypes(resource_id: str, df: pd.DataFrame) -> pd.DataFrame:
+    for col, dtype in _INGEST_DTYPES.get(resource_id, {}).items():
+        if col not in df:
+            continue
+        values = pd.to_numeric(df[col], errors="coerce")
+        # Integer dtypes can't hold NaN, keep float for columns with gaps
+        if dtype.startswith("int") and values.isna().any():
+            dtype = "float32"
+        df[col] = values.astype(dtype)
+
+    if resource_id == CROP_PRICE_ID and "arrival_date" in df:
+        # Parse once here instead of in every analysis; cache=True reuses the few distinct dates
+        df["arrival_date"] = pd.to_datetime(df["arrival_date"], format="%d/%m/%Y", errors="coerce", cache=True)
+    return df
+
+
+def _parse_response(resource_id: str, content: bytes) -> (pd.DataFrame | None, str, dict):
+    """Decodes a data.gov.in payload; returns (df or None if it had no records, title, raw data)."""
+    data = orjson.loads(content)
+    if 'records' in data and data['records']:
+        return _records_to_dataframe(resource_id, data['records']), data.get('title', 'No Title Found'), data
+    return None, "", data
+
+
+async def fetch_data_from_resource_async(resource_id: str, limit: int = 1000,
+                                         client: httpx.AsyncClient | None = None) -> (pd.DataFrame, str):
 
     if not DATA_GOV_API_KEY:
         print("Error: DATA_GOV_API_KEY not found. Set it in the .env file.")
         return pd.DataFrame(), ""
     
+    # Parquet reads/writes and JSON decoding + frame building are CPU/disk work,
+    # so they run in threads: the event loop keeps serving other requests (and
+    # stream heartbeats), and concurrent fetches overlap their parsing too
+    cached_df, cached_title = await asyncio.to_thread(_read_cache, resource_id, limit)
+    if cached_df is not None:
+        return cached_df, cached_title
+
     url = f"{BASE_URL}{resource_id}"
     params = {
         "api-key": DATA_GOV_API_KEY,
         "format": "json",
         "limit": str(limit)
     }
+    client = client or _CLIENT
 
     try:
-        response = requests.get(url, params=params)
+        response = await client.get(url, params=params)
         response.raise_for_status()
 
-        data = response.json()
+        df, title, data = await asyncio.to_thread(_parse_response, resource_id, response.content)
 
-        if 'records' in data and data['records']:
-            df = pd.DataFrame(data['records'])
-            title = data.get('title', 'No Title Found')
+        if df is not None:
             print(f"Successfully fetched {len(df)} records from '{title}'")
+            await asyncio.to_thread(_write_cache, resource_id, limit, df, title)
             return df, title
         
         else:
             print(f"Error: Resource '{resource_id}' returned no records or was empty.")
-            print(f"Raw Response: {json.dumps(data, indent=2)}")
+            print(f"Raw Response: {orjson.dumps(data, option=orjson.OPT_INDENT_2).decode()}")
             return pd.DataFrame(), ""
         
-    except requests.exceptions.HTTPError as http_err:
-        print(f"HTTP error occurred: {http_err} - {response.text}")
-    except requests.exceptions.ConnectionError as conn_err:
+    except httpx.HTTPStatusError as http_err:
+        print(f"HTTP error occurred: {http_err} - {http_err.response.text}")
+    except httpx.TransportError as conn_err:
         print(f"Connection error occurred: {conn_err}")
-    except requests.exceptions.JSONDecodeError:
+    except orjson.JSONDecodeError:
         print(f"Error: Failed to decode JSON. Response was: {response.text}")
     except Exception as e:
         print(f"An unexpected error occurred: {e}")
@@ -53,23 +176,34 @@ def fetch_data_from_resource(resource_id: str, limit: int = 1000) -> (pd.DataFra
     return pd.DataFrame(), ""
 
 
+def fetch_data_from_resource(resource_id: str, limit: int = 1000) -> (pd.DataFrame, str):
+    """
+    Synchronous wrapper around `fetch_data_from_resource_async`.
+    Uses its own short-lived client, since the shared one is tied to the
+    event loop it was first used on.
+    """
+    async def _fetch():
+        async with httpx.AsyncClient(http2=True, timeout=30) as client:
+            return await fetch_data_from_resource_async(resource_id, limit=limit, client=client)
+
+    return asyncio.run(_fetch())
+
+
 # --- This part is for testing the function directly ---
 if __name__ == "__main__":
     print("Testing data_fetch.py...")
     
     # Test 1: Crop Production (Known Good ID)
-    CROP_ID = "35be999b-0208-4354-b557-f6ca9a5355de"
-    print(f"\n--- Fetching Crop Production (ID: {CROP_ID}) ---")
-    crop_df, crop_title = fetch_data_from_resource(CROP_ID, limit=5)
+    print(f"\n--- Fetching Crop Production (ID: {CROP_PRODUCTION_ID}) ---")
+    crop_df, crop_title = fetch_data_from_resource(CROP_PRODUCTION_ID, limit=5)
     if not crop_df.empty:
         print("Test 1 SUCCESS. DataFrame head:")
         print(crop_df.head())
         print(f"Source Title: {crop_title}")
 
     # Test 2: Commodity Prices (Known Good ID)
-    PRICE_ID = "9ef84268-d588-465a-a308-a864a43d0070"
-    print(f"\n--- Fetching Commodity Prices (ID: {PRICE_ID}) ---")
-    price_df, price_title = fetch_data_from_resource(PRICE_ID, limit=5)
+    print(f"\n--- Fetching Commodity Prices (ID: {CROP_PRICE_ID}) ---")
+    price_df, price_title = fetch_data_from_resource(CROP_PRICE_ID, limit=5)
     if not price_df.empty:
         print("Test 2 SUCCESS. DataFrame head:")
         print(price_df.head())
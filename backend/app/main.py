@@ -1,8 +1,18 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse, FileResponse, ORJSONResponse
 from pydantic import BaseModel
+from contextlib import asynccontextmanager
 import sys
 import os
 import re 
+import orjson
+import time
+import uuid
+import base64
+import asyncio
+import tempfile
+from pathlib import Path
+from collections import OrderedDict
 
 current_dir = os.path.dirname(os.path.abspath(__file__))
 
@@ -13,92 +23,147 @@ project_root = os.path.dirname(backend_dir)
 sys.path.append(project_root)
 
 from backend.app.agent.agent import SamarthAgent
+from backend.app.agent.tools.code_interpreter import start_worker_pool, shutdown_worker_pool, PLOT_MARKER
 
 class QueryRequest(BaseModel):
     query: str
+    session_id: str | None = None # Turns with the same id share one agent (and its loaded data)
 
 class QueryResponse(BaseModel):
     answer: str
 
 class QueryResponse(BaseModel):
     answer: str
-    image_base64: str | None = None
+    plot_id: str | None = None # Fetch the image from GET /plot/{plot_id}.png
+    error: bool = False # The answer is an error message, not a result (don't cache it)
 
-app = FastAPI(title="Project Samarth Agent API")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Spawn and warm up the analysis workers before the first /chat request
+    start_worker_pool()
+    yield
+    for agent, _, _ in _sessions.values():
+        agent.close()
+    _sessions.clear()
+    shutdown_worker_pool()
+
+# orjson serializes the JSON responses (and the stream frames below)
+app = FastAPI(title="Project Samarth Agent API", lifespan=lifespan, default_response_class=ORJSONResponse)
+
+# Plots are served as raw PNGs from their own endpoint instead of base64 inside
+# the JSON. They live on disk so any uvicorn worker can serve any plot.
+PLOT_DIR = Path(tempfile.gettempdir()) / "samarth-plots"
+PLOT_TTL_SECONDS = 3600
+_PLOT_ID_RE = re.compile(r"[0-9a-f]{32}")
+
+
+def _store_plot(image_base64: str | None) -> str | None:
+    """Writes a plot to PLOT_DIR, returning its id. Also prunes expired plots."""
+    if not image_base64:
+        return None
+    PLOT_DIR.mkdir(parents=True, exist_ok=True)
+    now = time.time()
+    for path in PLOT_DIR.glob("*.png"):
+        try:
+            if now - path.stat().st_mtime > PLOT_TTL_SECONDS:
+                path.unlink()
+        except OSError:
+            pass # Already removed by another worker
+    plot_id = uuid.uuid4().hex
+    (PLOT_DIR / f"{plot_id}.png").write_bytes(base64.b64decode(image_base64))
+    return plot_id
+
+
+# Agents kept per chat session, so follow-up turns reuse the datasets (and their
+# shared-memory export) loaded by earlier turns. Each uvicorn worker has its own
+# table; a session landing on another worker just starts with a fresh agent.
+SESSION_MAX_AGENTS = 64
+SESSION_TTL_SECONDS = 1800
+_sessions: OrderedDict[str, tuple[SamarthAgent, asyncio.Lock, float]] = OrderedDict()
+
+
+def _evict_sessions(now: float):
+    """Closes idle sessions past the TTL, then the oldest ones over the size limit."""
+    idle = [sid for sid, (_, lock, last_used) in _sessions.items()
+            if now - last_used > SESSION_TTL_SECONDS and not lock.locked()]
+    for sid in idle:
+        _sessions.pop(sid)[0].close()
+    for sid in list(_sessions):
+        if len(_sessions) <= SESSION_MAX_AGENTS:
+            break
+        if not _sessions[sid][1].locked(): # Never close an agent mid-run
+            _sessions.pop(sid)[0].close()
+
+
+@asynccontextmanager
+async def _agent_for(session_id: str | None):
+    """Yields the agent for a request: the session's own, or a throwaway one."""
+    if not session_id:
+        # Agents share the LLM clients, so one per request is cheap and keeps
+        # concurrent requests from sharing loaded data or plots
+        agent = SamarthAgent()
+        try:
+            yield agent
+        finally:
+            agent.close() # Frees the shared-memory copy of its dataframes
+        return
+
+    now = time.time()
+    agent, lock, _ = _sessions.get(session_id) or (SamarthAgent(), asyncio.Lock(), now)
+    _sessions[session_id] = (agent, lock, now)
+    _sessions.move_to_end(session_id)
+    _evict_sessions(now)
+    async with lock: # One turn at a time per session
+        yield agent
 
-agent = SamarthAgent()
-print("SamarthAgent initialiazed.")
 
 
 
 import re # Keep this import
 
+# Leftovers that can precede the answer when no tool call JSON was found
+_ANSWER_PREFIXES = (
+    '{\n  "tool_call": {',
+    'Based on the analysis',
+    'Here is the breakdown',
+)
+
 def clean_final_answer(text: str) -> str:
     """
     Extracts the LAST block of natural language text after any potential
     JSON tool calls or code snippets.
     """
-    # 1. Remove potential plot markers first
-    plot_marker = "[Plot saved: "
-    if plot_marker in text:
-         start_index = text.find(plot_marker)
-         text = text[:start_index].strip() # Keep only text before plot marker
-
-    # 2. Find the index of the LAST closing curly brace '}'
-    # This usually marks the end of the last tool call JSON
-    last_brace_index = text.rfind('}')
-
-    # 3. If a brace is found, take the text *after* it
-    if last_brace_index != -1:
-        # Find the start of the next meaningful text block
-        # Look for the first newline character after the brace
-        next_newline = text.find('\n', last_brace_index)
-        if next_newline != -1:
-             # Take everything after the newline
-             cleaned_text = text[next_newline:].strip()
-             # If the result is just whitespace or empty, fallback needed
-             if cleaned_text:
-                  return cleaned_text
-        # Fallback: If no newline or only whitespace after brace,
-        # or if no brace was found initially, try removing common prefixes
-        # This is less reliable but a decent fallback.
-        prefixes_to_remove = [
-            '{\n  "tool_call": {', # Common start patterns
-            'Based on the analysis',
-            'Here is the breakdown'
-        ]
-        original_text = text # Keep original for final fallback
-        for prefix in prefixes_to_remove:
-             if text.startswith(prefix):
-                 text = text[len(prefix):].strip()
-                 break # Stop after removing the first matching prefix
-        # Final fallback: If cleaning resulted in empty string, return original (minus plot)
-        return text if text else original_text
-
-
-    # 4. If no closing brace was found, assume the text is already clean (or needs fallback)
-    else:
-         # Apply the same fallback prefix removal as above
-        prefixes_to_remove = [
-             '{\n  "tool_call": {',
-             'Based on the analysis',
-             'Here is the breakdown'
-        ]
-        original_text = text
-        for prefix in prefixes_to_remove:
-             if text.startswith(prefix):
-                 text = text[len(prefix):].strip()
-                 break
-        return text if text else original_text
+    # 1. Remove potential plot markers first (keep only text before it)
+    text = text.partition(PLOT_MARKER)[0].strip()
+
+    # 2. The LAST closing curly brace usually marks the end of the last tool call JSON;
+    #    the answer starts on the line after it
+    _, brace, after_brace = text.rpartition('}')
+    if brace:
+        _, newline, cleaned_text = after_brace.partition('\n')
+        cleaned_text = cleaned_text.strip()
+        if newline and cleaned_text:
+            return cleaned_text
+
+    # 3. Fallback: no brace, or nothing after it. Remove a known prefix instead.
+    #    If that leaves nothing, return the text (minus plot) unchanged.
+    for prefix in _ANSWER_PREFIXES:
+        if text.startswith(prefix):
+            return text[len(prefix):].strip() or text
+    return text
 
 @app.post("/chat", response_model=QueryResponse)
 async def chat_endpoint(request: QueryRequest):
     print(f"Received query: {request.query}")
     answer = "[Agent processing failed before completion]"
     image_data = None
+    plot_id = None
+    error = True
 
     try:
-        raw_answer, image_data = agent.run(query=request.query) # Returns tuple
+        async with _agent_for(request.session_id) as agent:
+            raw_answer, image_data = await agent.run(query=request.query) # Returns tuple
+            error = agent.last_run_failed or raw_answer is None
         raw_answer_str = str(raw_answer) if raw_answer is not None else "[Agent returned None]"
 
         # --- Clean the final answer text ---
@@ -108,13 +173,15 @@ async def chat_endpoint(request: QueryRequest):
         print(f"Agent raw answer: {raw_answer_str[:500]}...") # Log raw before cleaning
         print(f"Agent cleaned answer (text): {answer[:500]}...") # Log cleaned
         if image_data:
-            print("Agent answer includes a plot.")
+            plot_id = await asyncio.to_thread(_store_plot, image_data)
+            print(f"Agent answer includes a plot: {plot_id}")
 
     except Exception as e:
         # (Keep existing error handling)
         print(f"Error during agent execution: {e}")
         answer = f"An error occurred: {e}"
-        image_data = None
+        plot_id = None
+        error = True
 
     finally:
         # (Keep existing finally block for debug prints and return)
@@ -122,7 +189,82 @@ async def chat_endpoint(request: QueryRequest):
         answer_str = str(answer) # Use the cleaned answer
         print(f"Answer Text (first 100 chars): {answer_str[:100]}...")
         # ... (rest of finally block remains the same) ...
-        return QueryResponse(answer=answer_str, image_base64=image_data)
+        return QueryResponse(answer=answer_str, plot_id=plot_id, error=error)
+
+
+# Longest silence on /chat/stream before a heartbeat frame is sent
+STREAM_HEARTBEAT_SECONDS = 10
+
+
+def _frame(data: dict) -> bytes:
+    """One NDJSON line of the /chat/stream response."""
+    return orjson.dumps(data) + b"\n"
+
+
+@app.post("/chat/stream")
+async def chat_stream_endpoint(request: QueryRequest):
+    """
+    Same as /chat, but streams newline-delimited JSON frames as the agent works:
+    {"status": ...} progress updates, {"delta": ...} answer text, and finally
+    {"done": true, "answer": ..., "plot_id": ..., "error": ...}. While a step runs longer than
+    STREAM_HEARTBEAT_SECONDS, {"heartbeat": true} frames keep the stream alive, so
+    clients can use a short read timeout and cancel promptly.
+    """
+    print(f"Received streaming query: {request.query}")
+    queue: asyncio.Queue = asyncio.Queue()
+
+    async def run_agent():
+        try:
+            async with _agent_for(request.session_id) as agent:
+                raw_answer, image_data = await agent.run(query=request.query, on_event=queue.put_nowait)
+                return raw_answer, image_data, agent.last_run_failed or raw_answer is None
+        finally:
+            queue.put_nowait(None) # End of progress frames
+
+    async def frames():
+        task = asyncio.create_task(run_agent())
+        try:
+            while True:
+                try:
+                    frame = await asyncio.wait_for(queue.get(), STREAM_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield _frame({"heartbeat": True})
+                    continue
+                if frame is None:
+                    break
+                yield _frame(frame)
+
+            try:
+                raw_answer, image_data, error = task.result()
+                answer = clean_final_answer(str(raw_answer) if raw_answer is not None else "[Agent returned None]")
+                plot_id = await asyncio.to_thread(_store_plot, image_data)
+            except Exception as e:
+                print(f"Error during agent execution: {e}")
+                answer, plot_id, error = f"An error occurred: {e}", None, True
+
+            yield _frame({"delta": answer})
+            yield _frame({"done": True, "answer": answer, "plot_id": plot_id, "error": error})
+        finally:
+            # Client went away mid-stream: stop the agent rather than finish unseen work
+            if not task.done():
+                task.cancel()
+
+    return StreamingResponse(frames(), media_type="application/x-ndjson")
+
+
+@app.get("/plot/{plot_id}.png")
+async def get_plot(plot_id: str):
+    """Serves a plot produced by /chat or /chat/stream as a raw PNG."""
+    path = PLOT_DIR / f"{plot_id}.png"
+    if not _PLOT_ID_RE.fullmatch(plot_id) or not path.is_file():
+        raise HTTPException(status_code=404, detail="Plot not found or expired.")
+    return FileResponse(path, media_type="image/png")
+
+
+@app.get("/healthz")
+def healthz():
+    """Cheap liveness check; the frontend calls it on startup to wake the backend."""
+    return {"status": "ok"}
 
 
 @app.get("/")
@@ -17,4 +17,18 @@ if __name__ == "__main__":
     
 
     
-    uvicorn.run("backend.app.main:app", host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
+    # uvloop (libuv) and httptools are uvicorn's C-backed loop and HTTP parser.
+    # uvloop has no Windows build, so fall back to plain asyncio there.
+    loop = "asyncio" if sys.platform == "win32" else "uvloop"
+
+    # SAMARTH_RELOAD=1 for development: auto-reload runs a single process
+    if os.getenv("SAMARTH_RELOAD") == "1":
+        uvicorn.run("backend.app.main:app", host="0.0.0.0", port=8000, reload=True,
+                    loop=loop, http="httptools")
+    else:
+        # Each worker is a separate process with its own analysis pool, LLM
+        # clients and caches, so memory grows with every one: default to a
+        # single worker and raise WEB_CONCURRENCY (uvicorn's usual knob) if needed
+        workers = int(os.getenv("WEB_CONCURRENCY", 1))
+        uvicorn.run("backend.app.main:app", host="0.0.0.0", port=8000, workers=workers,
+                    loop=loop, http="httptools")
@@ -1,18 +1,156 @@
 import streamlit as st
 import requests
-import os
-import sys
-
-# --- Add project root to sys.path ---
-# Necessary if Streamlit runs from a different CWD
-current_dir = os.path.dirname(os.path.abspath(__file__))
-project_root = os.path.dirname(current_dir)
-if project_root not in sys.path:
-    sys.path.insert(0, project_root)
-# --- End path modification ---
+import httpx
+import asyncio
+import orjson
+import re
+import time
+import uuid
+import threading
+from collections import deque
+from cachetools import TTLCache
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 # --- Configuration ---
-BACKEND_URL = "https://project-samarth-backend-mnol.onrender.com/chat" # URL of our FastAPI endpoint
+BACKEND_BASE = "https://project-samarth-backend-mnol.onrender.com"
+BACKEND_URL = BACKEND_BASE + "/chat" # URL of our FastAPI endpoint
+HEALTH_URL = BACKEND_BASE + "/healthz"
+STREAM_URL = BACKEND_URL + "/stream" # NDJSON progress + answer frames
+# (connect, read): fail fast if the backend is unreachable, but give the agent time to answer
+REQUEST_TIMEOUT = (3.05, 600)
+# Streams get a frame at least every 10s (heartbeats), so a silent backend is
+# given up on quickly instead of holding the connection for the full 600s
+STREAM_TIMEOUT = (3.05, 30)
+# Repeat questions within this window are answered from the frontend cache
+ANSWER_CACHE_TTL = 600
+ANSWER_CACHE_MAX_ENTRIES = 256
+# Only the most recent messages are re-rendered on each rerun
+HISTORY_WINDOW = 60
+# Prompts written as a numbered list of questions are sent as concurrent queries
+MAX_SUBQUERIES = 4
+# One list item per line: "1. question" or "1) question"
+_SUBQUERY_ITEM_RE = re.compile(r"^\s*\d+[.)]\s+(.+?)\s*$")
+
+
+@st.cache_resource
+def get_session() -> requests.Session:
+    """One keep-alive session per server process, so chat turns reuse the backend connection."""
+    session = requests.Session()
+    # urllib3 only retries POSTs on connection errors, so a query is never sent twice
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=8,
+                          max_retries=Retry(total=2, backoff_factor=0.2))
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+@st.cache_resource(ttl=600)
+def warm_backend() -> bool:
+    """
+    Pings the backend in a background thread so a cold (e.g. spun-down) server
+    is already starting while the user types. Cached, so it runs once per server
+    process and again after the TTL, in case the backend went idle since.
+    """
+    session = get_session() # Resolved here: cached resources need the script thread
+
+    def ping():
+        try:
+            session.get(HEALTH_URL, timeout=(3.05, 60))
+        except requests.exceptions.RequestException as e:
+            print(f"Backend warm-up failed: {e}")
+
+    threading.Thread(target=ping, daemon=True).start()
+    return True
+
+
+@st.cache_resource
+def get_answer_cache() -> tuple[TTLCache, threading.Lock]:
+    """
+    Recent answers shared by all sessions, {normalized_prompt: (text, plot_ids)}.
+    st.cache_data can't wrap the streaming call (it writes to a placeholder as
+    frames arrive), so the answers are cached here instead.
+    """
+    return TTLCache(maxsize=ANSWER_CACHE_MAX_ENTRIES, ttl=ANSWER_CACHE_TTL), threading.Lock()
+
+
+def fetch_plot(plot_id: str) -> bytes:
+    """Downloads a plot's raw PNG bytes from the backend."""
+    response = get_session().get(f"{BACKEND_BASE}/plot/{plot_id}.png", timeout=REQUEST_TIMEOUT)
+    response.raise_for_status()
+    return response.content
+
+
+def split_subqueries(prompt: str) -> list[str]:
+    """
+    Splits a prompt into independent questions, or returns it whole.
+
+    Only an explicit numbered list (one "1. ..." item per line, nothing else)
+    is split. Consecutive questions in prose often build on each other ("Which
+    state produced the most rice? How much did it produce?"), and each split
+    question is answered without the others, so everything else is sent whole;
+    the backend still runs independent data fetches of one prompt in parallel.
+    """
+    lines = [line for line in prompt.splitlines() if line.strip()]
+    items = [_SUBQUERY_ITEM_RE.match(line) for line in lines]
+    if 1 < len(items) <= MAX_SUBQUERIES and all(items):
+        return [item.group(1) for item in items]
+    return [prompt]
+
+
+async def ask_all(subqueries: list[str]) -> list[tuple[str, str | None, bool]]:
+    """
+    Sends each question to /chat concurrently.
+
+    They go without a session id: each runs on its own throwaway agent, since
+    one session's agent answers a single turn at a time.
+
+    Returns:
+        list: (answer_text, plot_id_or_None, is_error) per question, in order
+    """
+    timeout = httpx.Timeout(REQUEST_TIMEOUT[1], connect=REQUEST_TIMEOUT[0])
+    async with httpx.AsyncClient(http2=True, timeout=timeout) as client:
+        async def ask(question: str) -> tuple[str, str | None, bool]:
+            response = await client.post(BACKEND_URL, json={"query": question})
+            response.raise_for_status()
+            answer_data = orjson.loads(response.content)
+            return (answer_data.get("answer", "Sorry, I couldn't get a response."), answer_data.get("plot_id"),
+                    answer_data.get("error", True))
+
+        return await asyncio.gather(*(ask(question) for question in subqueries))
+
+
+async def stream_backend(payload: dict, status_placeholder, result: dict):
+    """
+    Async generator over the answer text from /chat/stream, for st.write_stream.
+
+    Progress frames are shown in `status_placeholder` until the answer starts;
+    the final frame's plot id and error flag are stored in `result["plot_id"]`
+    and `result["error"]`.
+
+    Every status and heartbeat frame updates the page, which is where Streamlit
+    interrupts the run after the Stop button is clicked; leaving the `async with`
+    blocks then closes the connection, and the backend cancels the agent.
+    """
+    timeout = httpx.Timeout(STREAM_TIMEOUT[1], connect=STREAM_TIMEOUT[0])
+    started = time.monotonic()
+    status = "Thinking..."
+    async with httpx.AsyncClient(http2=True, timeout=timeout) as client:
+        async with client.stream("POST", STREAM_URL, json=payload) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line:
+                    continue
+                frame = orjson.loads(line)
+                if "status" in frame or "heartbeat" in frame:
+                    status = frame.get("status", status)
+                    status_placeholder.caption(f"{status} ({time.monotonic() - started:.0f}s)")
+                if "delta" in frame:
+                    status_placeholder.empty()
+                    yield frame["delta"]
+                if frame.get("done"):
+                    result["plot_id"] = frame.get("plot_id")
+                    result["error"] = frame.get("error", True)
 
 # --- Streamlit App ---
 
@@ -20,66 +158,150 @@ st.set_page_config(page_title="Project Samarth Q&A", layout="wide")
 st.title("🇮🇳 Project Samarth: Agri & Price Q&A Agent")
 st.caption("Ask complex questions about Indian agricultural production and market prices.")
 
+warm_backend()
+
+force_refresh = st.sidebar.checkbox("Force refresh", help="Ask the agent again even if this question was answered recently.")
+show_full_history = st.sidebar.checkbox("Show full history", help=f"Render every message, not just the last {HISTORY_WINDOW}.")
+
 # --- Initialize chat history ---
 # We store text content for history, display handles images separately
+# Streamlit reruns the whole script per input, so only a bounded window is
+# rendered by default; the full conversation is kept alongside, unrendered
+def new_conversation():
+    st.session_state.messages = deque(maxlen=HISTORY_WINDOW)
+    st.session_state.full_history = []
+    # Sent with every query so the backend keeps this conversation's loaded data
+    st.session_state.session_id = uuid.uuid4().hex
+
+
 if "messages" not in st.session_state:
-    st.session_state.messages = []
+    new_conversation()
+
+st.sidebar.button("New conversation", on_click=new_conversation)
+
+
+def add_message(role: str, content: str):
+    message = {"role": role, "content": content}
+    st.session_state.messages.append(message)
+    st.session_state.full_history.append(message)
+
+
+def stop_answer():
+    # Runs at the start of the rerun that interrupted the streaming answer
+    add_message("assistant", "_Stopped._")
+
 
 # --- Display chat messages from history ---
 # Note: History only stores text. Images are displayed live during generation.
-for message in st.session_state.messages:
+if show_full_history:
+    history = st.session_state.full_history
+else:
+    history = st.session_state.messages
+    if len(st.session_state.full_history) > len(history):
+        st.caption(f"Showing the last {len(history)} of {len(st.session_state.full_history)} messages.")
+for message in history:
     with st.chat_message(message["role"]):
         st.markdown(message["content"])
 
 # --- Accept user input ---
 if prompt := st.chat_input("Ask a question..."):
+    # Whitespace-only submits would otherwise run the whole agent pipeline
+    prompt = prompt.strip()
+    if not prompt:
+        st.stop()
+
     # Add user message to chat history
-    st.session_state.messages.append({"role": "user", "content": prompt})
+    add_message("user", prompt)
     # Display user message in chat message container
     with st.chat_message("user"):
         st.markdown(prompt)
 
     # --- Get response from backend ---
     with st.chat_message("assistant"):
+        status_placeholder = st.empty() # Agent progress while the answer is pending
         message_placeholder = st.empty()
-        image_placeholder = st.empty() # Placeholder specifically for the image
+        image_placeholder = st.empty() # Placeholder specifically for the images
         full_response_text = ""
-        image_base64 = None # Initialize image data variable
+        plot_ids = [] # Set when the answer comes with plots
 
-        # Display a loading indicator while waiting
-        with st.spinner("Agent is thinking..."):
-            try:
-                # Prepare the request payload
-                payload = {"query": prompt}
-
-                # Send the request to the FastAPI backend
-                response = requests.post(BACKEND_URL, json=payload, timeout=600) # Increased timeout
-                response.raise_for_status() # Raise an exception for bad status codes
-
-                # Get the answer and potential image from the JSON response
-                answer_data = response.json()
-                full_response_text = answer_data.get("answer", "Sorry, I couldn't get a response.")
-                image_base64 = answer_data.get("image_base64")
-
-            except requests.exceptions.Timeout:
-                 full_response_text = "Error: The request timed out. The agent might be taking too long."
-            except requests.exceptions.RequestException as e:
-                full_response_text = f"Error connecting to the backend: {e}"
-            except Exception as e:
-                 full_response_text = f"An unexpected error occurred: {e}"
-
-        # Display text response first
-        message_placeholder.markdown(full_response_text)
-
-        # Display image if it exists
-        if image_base64:
+        # Repeats (ignoring case and spacing) skip the backend
+        cache_key = " ".join(prompt.lower().split())
+        answer_cache, cache_lock = get_answer_cache()
+        with cache_lock:
+            cached = None if force_refresh else answer_cache.get(cache_key)
+
+        stop_placeholder = st.empty()
+        streamed = False
+        cacheable = False
+        subqueries = split_subqueries(prompt)
+        if cached:
+            full_response_text, plot_ids = cached
+        else:
+            # Display a loading indicator while waiting
+            with st.spinner("Agent is thinking..."):
+                try:
+                    if len(subqueries) > 1:
+                        # Independent questions: ask them all at once, then merge
+                        results = asyncio.run(ask_all(subqueries))
+                        # Sent without the session id, so say they didn't reuse its loaded data
+                        full_response_text = f"_Answered as {len(subqueries)} separate questions, each without this conversation's loaded data._\n\n"
+                        full_response_text += "\n\n".join(
+                            f"**{question}**\n\n{answer}" for question, (answer, _, _) in zip(subqueries, results))
+                        plot_ids = [plot_id for _, plot_id, _ in results if plot_id]
+                        cacheable = not any(error for _, _, error in results)
+                    else:
+                        payload = {"query": prompt, "session_id": st.session_state.session_id}
+                        try:
+                            # Stream from the FastAPI backend; text renders as it arrives
+                            stop_placeholder.button("Stop", on_click=stop_answer)
+                            result = {}
+                            full_response_text = message_placeholder.write_stream(
+                                stream_backend(payload, status_placeholder, result))
+                            full_response_text = full_response_text or "Sorry, I couldn't get a response."
+                            plot_ids = [result["plot_id"]] if result.get("plot_id") else []
+                            failed = result.get("error", True)
+                            streamed = True
+                        except httpx.HTTPStatusError as e:
+                            if e.response.status_code != 404:
+                                raise
+                            # Backend predates /chat/stream: fall back to the plain endpoint
+                            response = get_session().post(BACKEND_URL, json=payload, timeout=REQUEST_TIMEOUT)
+                            response.raise_for_status()
+                            answer_data = orjson.loads(response.content)
+                            full_response_text = answer_data.get("answer", "Sorry, I couldn't get a response.")
+                            plot_ids = [answer_data["plot_id"]] if answer_data.get("plot_id") else []
+                            failed = answer_data.get("error", True)
+                        # Only answers the backend marks as successful are cached
+                        cacheable = not failed
+
+                except (httpx.TimeoutException, requests.exceptions.Timeout):
+                     full_response_text = "Error: The request timed out. The agent might be taking too long."
+                except (httpx.HTTPError, requests.exceptions.RequestException) as e:
+                    full_response_text = f"Error connecting to the backend: {e}"
+                except Exception as e:
+                     full_response_text = f"An unexpected error occurred: {e}"
+
+            status_placeholder.empty()
+            stop_placeholder.empty()
+            if cacheable:
+                with cache_lock:
+                    answer_cache[cache_key] = (full_response_text, plot_ids)
+
+        # Display text response first (already on screen if it was streamed)
+        if not streamed:
+            message_placeholder.markdown(full_response_text)
+
+        # Display images if any. The raw PNG bytes come over the keep-alive
+        # session and go straight to st.image, so the browser never needs to
+        # reach the backend itself and nothing is base64-decoded client-side.
+        if plot_ids:
             try:
-                # Construct the data URI carefully
-                image_data_uri = f"data:image/png;base64,{image_base64.strip()}" # Add .strip() just in case
-                image_placeholder.image(image_data_uri, caption="Generated Plot")
+                with image_placeholder.container():
+                    for plot_id in plot_ids:
+                        st.image(fetch_plot(plot_id), caption="Generated Plot", output_format="PNG")
             except Exception as img_e:
                 image_placeholder.error(f"Failed to display image: {img_e}")
 
 
     # Add assistant response (text only) to chat history
-    st.session_state.messages.append({"role": "assistant", "content": full_response_text})
\ No newline at end of file
+    add_message("assistant", full_response_text)
\ No newline at end of file
@@ -1,5 +1,8 @@
 import google.generativeai as genai
+from google.api_core.exceptions import NotFound
 import os
+import json
+import time
 from dotenv import load_dotenv
 
 # Load API key from .env
@@ -10,30 +13,59 @@ if not GOOGLE_API_KEY:
     print("Error: GOOGLE_API_KEY not found in .env")
     exit()
 
+# The model listing changes rarely, so it is cached on disk (same directory as
+# the dataset cache) instead of costing an API round-trip on every run
+MODELS_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "samarth", "models.json")
+MODELS_CACHE_TTL_SECONDS = 86400
+# Models to try, in order of preference
+CANDIDATE_MODELS = ("models/gemini-1.5-pro-latest", "models/gemini-1.0-pro")
+
+
+def list_models_cached(path: str = MODELS_CACHE_PATH, ttl: int = MODELS_CACHE_TTL_SECONDS) -> list[str]:
+    """Names of models supporting generateContent, from the disk cache when fresh."""
+    try:
+        if time.time() - os.path.getmtime(path) < ttl:
+            with open(path) as f:
+                return json.load(f)
+    except (OSError, ValueError):
+        pass # Missing or unreadable cache: list again
+
+    try:
+        models = [m.name for m in genai.list_models() if 'generateContent' in m.supported_generation_methods]
+    except Exception as e:
+        print(f"Warning: Could not list models: {e}")
+        return []
+
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(models, f)
+    except OSError as e:
+        print(f"Warning: Could not write model cache {path}: {e}")
+    return models
+
+
 try:
     print("Configuring Google API...")
     genai.configure(api_key=GOOGLE_API_KEY)
 
-    print("Checking available models...")
-    # List models to ensure the API connection is working
-    models_list = [m.name for m in genai.list_models() if 'generateContent' in m.supported_generation_methods]
-    print(f"Available models: {models_list}")
-
-    # Choose a modern model name directly supported by the library
-    # Let's use the one LangChain was trying
-    model_name = "models/gemini-1.5-pro-latest"
-    if model_name not in models_list:
-        # Fallback if the latest isn't listed (shouldn't happen with latest lib)
-         model_name = "models/gemini-1.0-pro"
-         if model_name not in models_list:
-             print(f"Error: Neither gemini-1.5-pro-latest nor gemini-1.0-pro found!")
-             exit()
-
-    print(f"Attempting to use model: {model_name}")
-    model = genai.GenerativeModel(model_name)
-
-    print("Sending a simple prompt...")
-    response = model.generate_content("Explain AI in one sentence.")
+    # GenerativeModel() makes no API call; a missing model only shows up as
+    # NotFound on the first request, so try the candidates directly instead
+    # of listing every model first
+    for model_name in CANDIDATE_MODELS:
+        print(f"Attempting to use model: {model_name}")
+        model = genai.GenerativeModel(model_name)
+        try:
+            print("Sending a simple prompt...")
+            response = model.generate_content("Explain AI in one sentence.")
+            break
+        except NotFound:
+            print(f"Model {model_name} not found, trying the next one.")
+    else:
+        print(f"Error: None of {', '.join(CANDIDATE_MODELS)} found!")
+        # Only worth listing (cached for a day) to show what is available instead
+        print(f"Available models: {list_models_cached()}")
+        exit()
 
     print("\n--- SUCCESS ---")
     print(response.text)